@@ -1,29 +1,331 @@
+import asyncio
+import codecs
+import functools
+import importlib.util
 import requests
-from bs4 import BeautifulSoup
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from selectolax.lexbor import LexborHTMLParser
+import msgspec
 import re
+import sys
 import time
 from urllib.parse import unquote, parse_qs, urlencode
 import random
 import logging # Import logging
+import multiprocessing
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+try:
+    import diskcache # Optional on-disk tier of the 'load more' page cache
+except ImportError:
+    diskcache = None
+
+try:
+    import zstandard # Optional compression of the on-disk cache entries
+except ImportError:
+    zstandard = None
+
+try:
+    import httpx # Only AsyncTGStatParser needs it; the sync client runs on requests alone
+except ImportError:
+    httpx = None
+_HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None # httpx needs h2 for http2=True
 
 # --- Setup Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 # Use logging.debug for verbose, logging.info for standard messages, logging.warning/error for issues
 
+# --- Precompiled patterns used in the per-card parse loops ---
+_CHANNEL_HREF_RE = re.compile(r'/channel/(@[\w_]+|[\w\d\-]+)/stat') # Allow hyphens in ID
+_POST_ID_RE = re.compile(r'post-(\d+)')
+_TG_LINK_RE = re.compile(r'https://t(?:elegram)?\.(?:me|org)/|https://ttttt\.me/')
+_NUM_LEAD_RE = re.compile(r'([\d\s,km.]+)')
+_CHARSET_RE = re.compile(r'charset=["\']?([\w.:-]+)', re.IGNORECASE)
+
+# Search-card targets, fetched with a single selector call per card and dispatched by tag/class
+_TITLE_CLASSES = frozenset(('text-truncate', 'font-16', 'text-dark', 'mt-n1'))
+_SUBS_CLASSES = frozenset(('text-truncate', 'font-14', 'text-dark'))
+_STATS_CLASSES = frozenset(('col', 'col-12', 'col-sm-7'))
+_CATEGORY_CLASSES = frozenset(('border', 'rounded', 'bg-light', 'px-1'))
+_CARD_TARGETS_SELECTOR = ', '.join((
+    'a[href*="/stat"]',
+    'div.text-truncate.font-16.text-dark.mt-n1',
+    'div.text-truncate.font-14.text-dark',
+    'img.img-thumbnail',
+    '.col.col-12.col-sm-7',
+    'span.border.rounded.bg-light.px-1',
+))
+_CHANNEL_CARDS_SELECTOR = 'div#channels-list-holder > div.peer-item-row, body > div.peer-item-row'
+_CHANNEL_CARDS_FALLBACK_SELECTOR = 'div.peer-item-row'
+_STATS_COLUMNS_SELECTOR = '.col.col-4.pt-1'
+
+# Post-card selectors. Lexbor compiles a selector on every css()/css_first() call, so each card
+# is queried with as few (combined) selectors as possible.
+_POST_CARDS_SELECTOR = 'div.posts-list > div.post-container, body > div.post-container'
+_POST_CARDS_FALLBACK_SELECTOR = 'div.post-container'
+_POST_TIME_SELECTOR = 'div.post-header small'
+_POST_BODY_SELECTOR = 'div.post-body'
+_POST_TEXT_SELECTOR = 'div.post-text'
+_POST_PHOTO_SELECTOR = 'div.post-img, div.carousel'
+_POST_VIDEO_SELECTOR = 'div.wrapper-thumbnail, div.wrapper-video'
+_POST_IMAGE_SELECTOR = 'img.post-img-img'
+_POST_VIDEO_SOURCE_SELECTOR = 'video source[src]'
+_POST_STATS_ROW_SELECTOR = '.col.col-12.d-flex'
+# Stats buttons, fetched with a single selector call per post and dispatched by tooltip title
+_POST_VIEWS_TITLE = 'Количество просмотров публикации'
+_POST_SHARES_TITLE = 'Поделились'
+_POST_FORWARDS_TITLE = 'Пересылок всего'
+_POST_STATS_SELECTOR = ', '.join((
+    f'a.btn[data-original-title*="{_POST_VIEWS_TITLE}"]',
+    f'a.btn[data-original-title*="{_POST_SHARES_TITLE}"]',
+    f'span.btn[data-original-title*="{_POST_FORWARDS_TITLE}"]',
+))
+_POST_PERMALINK_SELECTOR = 'a[data-original-title="Постоянная ссылка на публикацию"][href]'
+_POST_DROPDOWN_LINKS_SELECTOR = 'a.dropdown-item[target="_blank"][href]'
+_POST_TG_LINK_SELECTOR = 'a[title*="Открыть в Telegram"][href]'
+
+# --- Typed decoding of the AJAX JSON responses ---
+class _AjaxResponse(msgspec.Struct):
+    """The fields read from search and 'load more posts' responses; anything else is skipped while decoding."""
+    status: str = ''
+    html: str | None = ''
+    hasMore: bool | int | None = False
+    nextPage: int | str | None = None
+    nextOffset: int | str | None = None
+    csrf: Any = msgspec.UNSET # Only present when the site rejects the CSRF token
+
+
+# One decoder for all responses: msgspec decodes the raw bytes straight into the struct, no intermediate dict
+_AJAX_DECODER = msgspec.json.Decoder(_AjaxResponse)
+
+# --- Parsed records ---
+@dataclass(slots=True)
+class ChannelInfo:
+    """A channel card from the search results."""
+    tgstat_url: str = ''
+    username: str | None = None
+    title: str = 'N/A'
+    avatar_url: str | None = None
+    subscribers: int | None = None
+    subscribers_str: str = 'N/A'
+    avg_reach: int | None = None
+    avg_reach_str: str = 'N/A'
+    ci_index: int | None = None
+    ci_index_str: str = 'N/A'
+    category: str = 'N/A'
+
+    def to_dict(self):
+        """Returns the fields as a plain dict, e.g. for JSON serialization."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+@dataclass(slots=True)
+class PostInfo:
+    """A post card from a channel page or a 'load more posts' response."""
+    id: int | None = None
+    datetime_str: str = 'N/A'
+    text: str = ''
+    has_photo: bool = False
+    has_video: bool = False
+    has_document: bool = False
+    image_url: str | None = None
+    video_url: str | None = None
+    views: int | None = None
+    views_str: str = 'N/A'
+    shares: int | None = None
+    shares_str: str = 'N/A'
+    forwards: int | None = None
+    forwards_str: str = 'N/A'
+    tgstat_post_url: str | None = None
+    telegram_post_url: str | None = None
+
+    def to_dict(self):
+        """Returns the fields as a plain dict, e.g. for JSON serialization."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def to_columns(records, record_type):
+    """
+    Converts a list of ChannelInfo/PostInfo records into a dict of per-field lists,
+    e.g. for building a DataFrame or aggregating a single field such as views.
+    """
+    return {name: [getattr(record, name) for record in records] for name in record_type.__slots__}
+
+
+# --- Constant POST form fields, urlencoded once ---
+# Field order follows the browser's curl: `countries=` must come before `countries[ID]=ID`,
+# and the repeated flags (noRedLabel=0&noRedLabel=1, ...) are sent exactly as the site does.
+_SEARCH_FIELDS_BEFORE_COUNTRY = urlencode((
+    ("inAbout", "0"), ("categories", ""), ("countries", ""),
+))
+_SEARCH_FIELDS_AFTER_COUNTRY = urlencode((
+    ("languages", ""), ("channelType", ""), ("age", "0-120"), ("err", "0-100"),
+    ("er", "0"), ("male", "0"), ("female", "0"), ("participantsCountFrom", ""),
+    ("participantsCountTo", ""), ("avgReachFrom", ""), ("avgReachTo", ""),
+    ("avgReach24From", ""), ("avgReach24To", ""), ("ciFrom", ""), ("ciTo", ""),
+    ("isVerified", "0"), ("isRknVerified", "0"), ("isStoriesAvailable", "0"),
+    ("noRedLabel", "0"), ("noRedLabel", "1"),
+    ("noScam", "0"), ("noScam", "1"),
+    ("noDead", "0"), ("noDead", "1"),
+))
+_MORE_POSTS_STATIC_FIELDS = urlencode((
+    ("date", "0"), ("q", ""),
+    ("hideDeleted", "0"), ("hideDeleted", "1"), # As per curl
+    ("hideForwards", "0"),
+))
+
+
+def _has_class(node, class_name):
+    """Checks whether a selectolax node carries the given CSS class."""
+    return class_name in (node.attributes.get('class') or '').split()
+
+
+# Latin and Cyrillic magnitude suffixes of human-readable counts, looked up by the last character
+_NUMBER_SUFFIX_MULTIPLIERS = {
+    'k': 1_000, 'K': 1_000, 'к': 1_000, 'К': 1_000,
+    'm': 1_000_000, 'M': 1_000_000, 'м': 1_000_000, 'М': 1_000_000,
+}
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_number(text):
+    """
+    Helper to parse numbers like '2m', '38.2k', '9279489'.
+    Callers pass stripped text; the single-pass fast path only inspects the last character.
+    Memoized: view/share counts repeat heavily across cards ('1.2k', '15', ...), so most calls are cache hits.
+    """
+    if not text or text == 'N/A' or text == 'n/a':
+        return 0
+    multiplier = _NUMBER_SUFFIX_MULTIPLIERS.get(text[-1])
+    try:
+        if multiplier is not None:
+            return int(float(text[:-1].replace(',', '.')) * multiplier)
+        try:
+            return int(text)
+        except ValueError:
+             # If direct int fails, try float then int (handles cases like '59.5' or '59,5')
+             return int(float(text.replace(',', '.')))
+    except ValueError:
+        if ' ' in text: # Slow path for grouped digits like '12 345'
+            return _parse_number(text.replace(' ', ''))
+        logging.warning(f"Could not parse number: '{text}'")
+        return None # Indicate parsing failure
 
-class TGStatParser:
+
+def _call_after_delay(delay_range, description, func, *args, cancel=None):
     """
-    A class to interact with TGStat.ru for searching channels and fetching posts.
-    Handles CSRF tokens and session management.
+    Sleeps for a random politeness delay, then calls func(*args) and returns its result.
+    If the cancel event (a threading.Event) is set before the delay is over, returns None without calling func.
+    """
+    sleep_time = random.uniform(*delay_range)
+    logging.info(f"Sleeping for {sleep_time:.2f} seconds before {description}...")
+    if cancel is None:
+        time.sleep(sleep_time)
+    elif cancel.wait(sleep_time):
+        logging.debug(f"{description.capitalize()} abandoned.")
+        return None
+    return func(*args)
+
+
+class _PageCache:
+    """
+    Two-tier TTL cache of raw 'load more' responses keyed by (channel, page_id, offset).
+
+    The in-memory tier is an LRU of up to maxsize entries; with a directory (and diskcache installed)
+    entries are also kept on disk, so re-runs polling the same channel skip the historical pages.
+    Raw bytes are stored rather than parsed posts, so callers never share mutable PostInfo objects.
+    On disk they are zstd-compressed when zstandard is installed; the templated markup shrinks several-fold.
+    """
+
+    DISK_COMPRESSION_LEVEL = 6
+    _ZSTD_MAGIC = b'\x28\xb5\x2f\xfd' # Frame header; plain JSON entries start with '{'
+
+    def __init__(self, ttl=600, maxsize=512, directory=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict() # key -> (monotonic expiry time, raw bytes)
+        self._lock = threading.Lock()
+        self._disk = None
+        if directory and ttl > 0:
+            if diskcache is None:
+                logging.warning("diskcache is not installed; the page cache stays in memory only.")
+            else:
+                self._disk = diskcache.Cache(directory)
+
+    def get(self, key):
+        """Returns the cached raw response for key, or None if it is missing or expired."""
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    return entry[1]
+                del self._entries[key]
+        if self._disk is not None:
+            raw, expire_time = self._disk.get(key, expire_time=True)
+            if raw is not None and raw.startswith(self._ZSTD_MAGIC):
+                raw = zstandard.decompress(raw) if zstandard is not None else None
+            if raw is not None:
+                # Keep the disk entry's expiry rather than granting it a fresh ttl in memory
+                remaining = self.ttl if expire_time is None else expire_time - time.time()
+                self._remember(key, raw, time.monotonic() + remaining)
+                return raw
+        return None
+
+    def __contains__(self, key):
+        # Goes through get() so an entry that cannot be decoded (zstd without zstandard) is not reported;
+        # a disk hit is loaded into memory for the get() that follows.
+        return self.get(key) is not None
+
+    @property
+    def on_disk(self):
+        """Whether lookups may touch the on-disk tier."""
+        return self._disk is not None
+
+    def set(self, key, raw):
+        """Caches a raw response for ttl seconds."""
+        if self.ttl <= 0:
+            return
+        self._remember(key, raw)
+        if self._disk is not None:
+            if zstandard is not None:
+                raw = zstandard.compress(raw, self.DISK_COMPRESSION_LEVEL)
+            self._disk.set(key, raw, expire=self.ttl)
+
+    def _remember(self, key, raw, expires_at=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl if expires_at is None else expires_at, raw)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def close(self):
+        """Closes the on-disk tier, if any."""
+        if self._disk is not None:
+            self._disk.close()
+
+
+class _TGStatBase:
+    """
+    Shared request-building and HTML-parsing logic for the TGStat.ru clients.
+    Subclasses provide the transport (blocking requests or asyncio).
     """
     BASE_URL = "https://tgstat.ru"
     SEARCH_URL = f"{BASE_URL}/channels/search"
+    # No Accept-Encoding here: requests and httpx each advertise exactly the encodings they can decode
+    # with the installed packages (br needs brotli/brotlicffi, zstd needs zstandard), so responses are
+    # never sent in a format the client would hand over undecoded.
     DEFAULT_HEADERS = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:137.0) Gecko/20100101 Firefox/137.0",
         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
         "Accept-Language": "ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3",
-        "Accept-Encoding": "gzip, deflate, br, zstd",
         "Connection": "keep-alive",
         "Upgrade-Insecure-Requests": "1",
         "Sec-Fetch-Dest": "document",
@@ -40,248 +342,213 @@ class TGStatParser:
         "Sec-Fetch-Mode": "cors",
         "Priority": "u=0",
     }
+    # Per-request header overrides, built once. The HTTP session already carries DEFAULT_HEADERS
+    # and merges these on top, so no per-request copy of the full header set is needed.
+    PAGE_GET_HEADERS = {"Referer": BASE_URL + "/"} # Generic referer for CSRF refreshes
+    CHANNEL_GET_HEADERS = {"Referer": SEARCH_URL} # Referer from search results
+    SEARCH_POST_HEADERS = {**AJAX_HEADERS, "Referer": SEARCH_URL}
 
-    def __init__(self, verbose=True): # verbose flag is now handled by logging level
-        """
-        Initializes the parser with a requests session and fetches the initial CSRF token.
-        """
-        self.session = requests.Session()
-        self.session.headers.update(self.DEFAULT_HEADERS)
-        self.csrf_token_form = None # Token specifically for POST request data bodies
-        if not self._refresh_csrf_token():
-             logging.error("Failed to initialize TGStatParser: Could not obtain CSRF token.")
-             raise ConnectionError("Failed to initialize TGStatParser: Could not obtain CSRF token.")
+    CSRF_REJECTED_STATUSES = (403, 419)
 
-    def _refresh_csrf_token(self, url_to_visit=None):
-        """
-        Fetches a page to update session cookies and extract the necessary CSRF token.
-        Returns True if successful, False otherwise.
-        """
-        url = url_to_visit or self.SEARCH_URL # Use search page by default
-        logging.info(f"Refreshing CSRF token from {url}...")
-        headers = self.DEFAULT_HEADERS.copy()
-        headers["Referer"] = self.BASE_URL + "/" # Add a generic referer
+    _parse_number = staticmethod(_parse_number) # Module-level so its lru_cache is shared by every instance
 
-        try:
-            response = self.session.get(url, headers=headers, timeout=20)
-            response.raise_for_status()
+    def _is_csrf_error(self, result):
+        """Checks whether a decoded _AjaxResponse reports a rejected CSRF token."""
+        return result.status == 'error' and result.csrf is not msgspec.UNSET
 
-            soup = BeautifulSoup(response.text, 'html.parser')
-            meta_tag = soup.find('meta', {'name': 'csrf-token'})
+    def _page_cache_key(self, channel_segment, last_post_id, offset):
+        """Cache key of a 'load more' page; cursors are normalized since they arrive as int or str."""
+        return (channel_segment.lower(), str(last_post_id), str(offset))
 
-            if meta_tag and 'content' in meta_tag.attrs:
-                self.csrf_token_form = meta_tag['content']
-                logging.info(f"Obtained CSRF token for forms: {self.csrf_token_form[:10]}...")
-                if '_tgstat_csrk' in self.session.cookies:
-                    logging.info("Session cookie '_tgstat_csrk' is set.")
-                else:
-                     logging.warning("Warning: Session cookie '_tgstat_csrk' was not explicitly found after GET, but session might still handle it.")
-                return True
-            else:
-                input_tag = soup.find('input', {'name': '_tgstat_csrk'})
-                if input_tag and 'value' in input_tag.attrs:
-                    self.csrf_token_form = input_tag['value']
-                    logging.info(f"Obtained CSRF token from input: {self.csrf_token_form[:10]}...")
-                    return True
-                else:
-                    logging.error("Failed to find CSRF token in meta tag or input field.")
-                    self.csrf_token_form = None
-                    return False
+    def _is_page_cached(self, channel_username_or_id, last_post_id, offset):
+        """Checks whether a 'load more' page would be served from the page cache."""
+        return self._page_cache_key(channel_username_or_id.lstrip('@'), last_post_id, offset) in self._page_cache
 
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Error refreshing CSRF token: {e}")
-            self.csrf_token_form = None
-            return False
-        except Exception as e:
-            logging.error(f"Unexpected error during CSRF refresh: {e}", exc_info=True)
-            self.csrf_token_form = None
-            return False
+    def _cached_ajax_response(self, cache_key, description):
+        """Returns the decoded cached response for cache_key, or None."""
+        if cache_key is None:
+            return None
+        raw = self._page_cache.get(cache_key)
+        if raw is None:
+            return None
+        logging.info(f"{description} response served from cache.")
+        return _AJAX_DECODER.decode(raw)
 
-    def _make_search_request(self, query, page=0, offset=0, sort="participants", country_id=1):
+    def _cache_ajax_response(self, cache_key, result, raw):
+        """Caches the raw body of a successful response under cache_key."""
+        if cache_key is not None and result.status == 'ok':
+            self._page_cache.set(cache_key, raw)
+
+    @staticmethod
+    def _utf8_page(content, content_type):
         """
-        Internal method to perform the actual channel search POST request.
+        Returns a page body as UTF-8 bytes for LexborHTMLParser, which reads bytes input as UTF-8.
+        A body whose Content-Type header declares another charset is re-encoded first.
         """
-        if not self.csrf_token_form:
-            logging.warning("No CSRF form token found. Attempting to refresh...")
-            if not self._refresh_csrf_token():
-                 logging.error("Failed to refresh CSRF token. Search aborted.")
-                 return None
-
-        search_data = {
-            "_tgstat_csrk": self.csrf_token_form,
-            "view": "list",
-            "sort": sort,
-            "q": query,
-            "inAbout": "0",
-            "categories": "",
-            "countries": "",
-            # Use f-string for dynamic key based on country_id
-            f"countries[{country_id}]": str(country_id),
-            "languages": "",
-            "channelType": "",
-            "age": "0-120",
-            "err": "0-100",
-            "er": "0",
-            "male": "0",
-            "female": "0",
-            "participantsCountFrom": "",
-            "participantsCountTo": "",
-            "avgReachFrom": "",
-            "avgReachTo": "",
-            "avgReach24From": "",
-            "avgReach24To": "",
-            "ciFrom": "",
-            "ciTo": "",
-            "isVerified": "0",
-            "isRknVerified": "0",
-            "isStoriesAvailable": "0",
-            # Using list of tuples for repeated keys, ensure urlencode is used
-            # "noRedLabel": "1", # Simpler if only '1' is needed
-            # "noScam": "1",
-            # "noDead": "1",
-            "page": page,
-            "offset": offset,
-        }
-        # Use list of tuples ONLY if multiple values for the same key are strictly needed
-        search_data_list = [
-            ("_tgstat_csrk", self.csrf_token_form),
-            ("view", "list"), ("sort", sort), ("q", query), ("inAbout", "0"),
-            ("categories", ""), ("countries", ""),
-            # Correctly handle array format for country - using the country_id as the key value pair target
-            # This format `countries[ID]=ID` is strange but matches the initial curl
-            (f"countries[{country_id}]", str(country_id)),
-            # If the simpler format `countries[]=ID` is desired, use this instead:
-            # ("countries[]", str(country_id)),
-            ("languages", ""), ("channelType", ""), ("age", "0-120"), ("err", "0-100"),
-            ("er", "0"), ("male", "0"), ("female", "0"), ("participantsCountFrom", ""),
-            ("participantsCountTo", ""), ("avgReachFrom", ""), ("avgReachTo", ""),
-            ("avgReach24From", ""), ("avgReach24To", ""), ("ciFrom", ""), ("ciTo", ""),
-            ("isVerified", "0"), ("isRknVerified", "0"), ("isStoriesAvailable", "0"),
-            # Include all necessary flags as per curl
-            ("noRedLabel", "0"), ("noRedLabel", "1"),
-            ("noScam", "0"), ("noScam", "1"),
-            ("noDead", "0"), ("noDead", "1"),
-            ("page", page), ("offset", offset),
-        ]
-
-
-        headers = self.session.headers.copy()
-        headers.update(self.AJAX_HEADERS)
-        headers["Referer"] = self.SEARCH_URL
-
-        logging.info(f"Searching channels with query: '{query}', page: {page}, offset: {offset}")
+        match = _CHARSET_RE.search(content_type or '')
+        if not match:
+            return content
         try:
-            # Use urlencode with doseq=True when data is a list of tuples
-            response = self.session.post(
-                self.SEARCH_URL,
-                data=urlencode(search_data_list, doseq=True),
-                # data=search_data, # Use this if search_data is a dict
-                headers=headers,
-                timeout=20
-            )
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Search request failed: {e}")
-            return None
-        except json.JSONDecodeError:
-            logging.error(f"Failed to decode JSON response from search.")
-            logging.debug(f"Response Text: {response.text[:500]}...")
-            return None
+            charset = codecs.lookup(match.group(1)).name
+        except LookupError:
+            return content # Unknown charset: leave it to the parser
+        if charset == 'utf-8':
+            return content
+        return content.decode(charset, errors='replace').encode('utf-8')
+
+    def _channel_post_headers(self, channel_page_url):
+        """Returns the cached AJAX headers for 'load more posts' requests sent from a channel page."""
+        headers = self._channel_post_headers_cache.get(channel_page_url)
+        if headers is None:
+            headers = self._channel_post_headers_cache[channel_page_url] = {**self.AJAX_HEADERS, "Referer": channel_page_url}
+        return headers
+
+    def _extract_csrf_token(self, html_content):
+        """
+        Extracts the CSRF token from a full TGStat page.
+        Accepts UTF-8 bytes (see _utf8_page) or a str.
+        Returns the token string, or None if neither the meta tag nor the form input is present.
+        """
+        tree = LexborHTMLParser(html_content)
+        meta_tag = tree.css_first('meta[name="csrf-token"][content]')
+        if meta_tag:
+            token = meta_tag.attributes['content']
+            logging.info(f"Obtained CSRF token for forms: {token[:10]}...")
+            return token
+
+        input_tag = tree.css_first('input[name="_tgstat_csrk"][value]')
+        if input_tag:
+            token = input_tag.attributes['value']
+            logging.info(f"Obtained CSRF token from input: {token[:10]}...")
+            return token
+
+        logging.error("Failed to find CSRF token in meta tag or input field.")
+        return None
+
+    def _build_search_body(self, query, page, offset, sort, country_id):
+        """Builds the urlencoded form body for the channel search POST request."""
+        # Only the token, query, sort, country and cursor change between calls;
+        # everything else is spliced in from the pre-encoded constant segments.
+        return "&".join((
+            urlencode((("_tgstat_csrk", self.csrf_token_form), ("view", "list"), ("sort", sort), ("q", query))),
+            _SEARCH_FIELDS_BEFORE_COUNTRY,
+            # This format `countries[ID]=ID` is strange but matches the initial curl
+            urlencode(((f"countries[{country_id}]", country_id),)),
+            _SEARCH_FIELDS_AFTER_COUNTRY,
+            urlencode((("page", page), ("offset", offset))),
+        ))
+
+    def _build_more_posts_body(self, last_post_id, offset):
+        """Builds the urlencoded form body for the 'load more posts' POST request."""
+        return "&".join((
+            urlencode((("_tgstat_csrk", self.csrf_token_form),)),
+            _MORE_POSTS_STATIC_FIELDS,
+            urlencode((("page", last_post_id), ("offset", offset))),
+        ))
 
     def _parse_search_html(self, html_content):
         """Parses the HTML returned by the search request."""
-        soup = BeautifulSoup(html_content, 'html.parser')
+        tree = LexborHTMLParser(html_content)
         channels = []
-        # Find the main container for channel cards if direct selection fails
-        container = soup.find('div', id='channels-list-holder') or soup
-        channel_cards = container.find_all('div', class_='peer-item-row', recursive=False) # Look only for direct children
+        # Look only for direct children of the list holder (or of <body> for a bare fragment)
+        channel_cards = tree.css(_CHANNEL_CARDS_SELECTOR)
 
         if not channel_cards:
              logging.warning("Could not find 'peer-item-row' divs directly. Searching deeper.")
              # Fallback to searching anywhere if the structure is nested differently
-             channel_cards = soup.find_all('div', class_='peer-item-row')
+             channel_cards = tree.css(_CHANNEL_CARDS_FALLBACK_SELECTOR)
 
         logging.info(f"Found {len(channel_cards)} potential channel cards in search HTML.")
 
         for card in channel_cards:
             try:
-                channel_info = {}
-                link_tag = card.find('a', href=re.compile(r'/channel/(@[\w_]+|[\w\d\-]+)/stat')) # Allow hyphens in ID
+                channel_info = ChannelInfo()
+                # One selector-engine pass collects every node of interest (in document order);
+                # the first node fitting each role wins, matching what per-role css_first calls returned.
+                link_tag = title_tag = img_tag = stats_container = subs_div = category_tag = None
+                match = None
+                for node in card.css(_CARD_TARGETS_SELECTOR):
+                    tag = node.tag
+                    if tag == 'a':
+                        if link_tag is None:
+                            match = _CHANNEL_HREF_RE.search(node.attributes.get('href') or '')
+                            if match:
+                                link_tag = node
+                        continue
+                    if tag == 'img':
+                        if img_tag is None and _has_class(node, 'img-thumbnail'):
+                            img_tag = node
+                        continue
+                    classes = set((node.attributes.get('class') or '').split())
+                    if title_tag is None and tag == 'div' and classes >= _TITLE_CLASSES:
+                        title_tag = node
+                    if subs_div is None and tag == 'div' and classes >= _SUBS_CLASSES:
+                        subs_div = node
+                    if stats_container is None and classes >= _STATS_CLASSES:
+                        stats_container = node
+                    if category_tag is None and tag == 'span' and classes >= _CATEGORY_CLASSES:
+                        category_tag = node
                 if not link_tag:
                     logging.warning("Skipping card, no valid link tag found.")
                     continue
 
-                href = link_tag['href']
+                href = link_tag.attributes['href']
                 # FIX: Correct URL construction
                 if href.startswith('/'):
-                    channel_info['tgstat_url'] = self.BASE_URL + href
+                    channel_info.tgstat_url = self.BASE_URL + href
                 elif href.startswith('http'):
-                    channel_info['tgstat_url'] = href # Already absolute
+                    channel_info.tgstat_url = href # Already absolute
                 else:
                     # Handle unexpected format, maybe log a warning
                     logging.warning(f"Unexpected href format: {href}. Prepending base URL.")
-                    channel_info['tgstat_url'] = f"{self.BASE_URL}/{href}" # Best guess
+                    channel_info.tgstat_url = f"{self.BASE_URL}/{href}" # Best guess
 
-                match = re.search(r'/channel/(@[\w_]+|[\w\d\-]+)/stat', href)
-                channel_info['username'] = match.group(1) if match else None
+                channel_info.username = match.group(1)
 
                 # FIX: More specific selector for title based on provided HTML
-                title_tag = card.find('div', class_='text-truncate font-16 text-dark mt-n1')
-                channel_info['title'] = title_tag.text.strip() if title_tag else 'N/A'
-                if channel_info['title'] == 'N/A':
-                     logging.warning(f"Could not find title for {channel_info.get('username','N/A')}. Check selector: 'div.text-truncate.font-16.text-dark.mt-n1'")
+                channel_info.title = title_tag.text().strip() if title_tag else 'N/A'
+                if channel_info.title == 'N/A':
+                     logging.warning(f"Could not find title for {channel_info.username}. Check selector: 'div.text-truncate.font-16.text-dark.mt-n1'")
 
 
-                img_tag = card.find('img', class_='img-thumbnail')
-                channel_info['avatar_url'] = img_tag['src'] if img_tag and img_tag.get('src') else None
-                if channel_info['avatar_url'] and channel_info['avatar_url'].startswith('//'):
-                     channel_info['avatar_url'] = 'https:' + channel_info['avatar_url']
+                channel_info.avatar_url = (img_tag.attributes.get('src') or None) if img_tag else None
+                if channel_info.avatar_url and channel_info.avatar_url.startswith('//'):
+                     channel_info.avatar_url = 'https:' + channel_info.avatar_url
 
                 # Extract stats
-                stats_container = card.select_one('.col.col-12.col-sm-7')
-                channel_info['subscribers'] = None
-                channel_info['subscribers_str'] = 'N/A'
-                channel_info['avg_reach'] = None
-                channel_info['avg_reach_str'] = 'N/A'
-                channel_info['ci_index'] = None
-                channel_info['ci_index_str'] = 'N/A'
-
                 if stats_container:
-                     stats_cols = stats_container.select('.col.col-4.pt-1')
+                     stats_cols = stats_container.css(_STATS_COLUMNS_SELECTOR)
                      if len(stats_cols) == 3:
                          try:
-                             subs_text = stats_cols[0].select_one('h4').text.strip().replace(' ', '')
-                             channel_info['subscribers_str'] = subs_text
-                             channel_info['subscribers'] = self._parse_number(subs_text)
+                             subs_text = stats_cols[0].css_first('h4').text().strip().replace(' ', '')
+                             channel_info.subscribers_str = subs_text
+                             channel_info.subscribers = self._parse_number(subs_text)
                          except AttributeError: pass # Ignore if h4 not found
 
                          try:
-                             reach_text = stats_cols[1].select_one('h4').text.strip()
-                             channel_info['avg_reach_str'] = reach_text
-                             channel_info['avg_reach'] = self._parse_number(reach_text)
+                             reach_text = stats_cols[1].css_first('h4').text().strip()
+                             channel_info.avg_reach_str = reach_text
+                             channel_info.avg_reach = self._parse_number(reach_text)
                          except AttributeError: pass
 
                          try:
-                             ci_text = stats_cols[2].select_one('h4').text.strip().replace(' ', '')
-                             channel_info['ci_index_str'] = ci_text
-                             channel_info['ci_index'] = self._parse_number(ci_text)
+                             ci_text = stats_cols[2].css_first('h4').text().strip().replace(' ', '')
+                             channel_info.ci_index_str = ci_text
+                             channel_info.ci_index = self._parse_number(ci_text)
                          except AttributeError: pass
                      else:
-                         logging.warning(f"Expected 3 stats columns, found {len(stats_cols)} for {channel_info.get('username','N/A')}")
+                         logging.warning(f"Expected 3 stats columns, found {len(stats_cols)} for {channel_info.username}")
 
                 # Fallback if stats columns not found/parsed correctly
-                if channel_info['subscribers'] is None:
-                     subs_div = card.find('div', class_='text-truncate font-14 text-dark')
+                if channel_info.subscribers is None:
                      if subs_div:
-                          subs_match = re.search(r'([\d\s,km.]+)', subs_div.text) # Extract leading number part
+                          subs_match = _NUM_LEAD_RE.search(subs_div.text()) # Extract leading number part
                           if subs_match:
                                subs_text = subs_match.group(1).strip().replace(' ', '')
-                               channel_info['subscribers_str'] = subs_text
-                               channel_info['subscribers'] = self._parse_number(subs_text)
+                               channel_info.subscribers_str = subs_text
+                               channel_info.subscribers = self._parse_number(subs_text)
 
-                category_tag = card.find('span', class_='border rounded bg-light px-1')
-                channel_info['category'] = category_tag.text.strip() if category_tag else 'N/A'
+                channel_info.category = category_tag.text().strip() if category_tag else 'N/A'
 
                 channels.append(channel_info)
             except Exception as e:
@@ -290,26 +557,305 @@ class TGStatParser:
 
         return channels
 
-    def _parse_number(self, text):
-        """Helper to parse numbers like '2m', '38.2k', '9279489'."""
-        text = text.lower().strip().replace(',', '.').replace(' ', '')
-        if not text or text == 'n/a' or text == '0':
-            return 0
+    def _extract_post_id(self, post_tag):
+        """Extracts numeric post ID from tag id like 'post-71374303853'."""
+        post_id_str = post_tag.attributes.get('id') or ''
+        match = _POST_ID_RE.search(post_id_str)
+        return int(match.group(1)) if match else None
+
+    def _parse_channel_page(self, html_content, limit=None):
+        """
+        Parses a full channel page in one pass.
+        Returns (csrf_token, posts); the token is None if the page carries no csrf-token meta tag.
+        """
+        tree = LexborHTMLParser(html_content)
+        meta_tag = tree.css_first('meta[name="csrf-token"]')
+        csrf_token = meta_tag.attributes.get('content') if meta_tag else None
+        return csrf_token, self._parse_posts_tree(tree, limit)
+
+    def _parse_posts_html(self, html_content, limit=None):
+        """
+        Parses HTML containing one or more post cards.
+        If limit is given, parsing stops once that many posts have been collected.
+        """
+        return self._parse_posts_tree(LexborHTMLParser(html_content), limit)
+
+    def _parse_posts_tree(self, tree, limit=None):
+        """Extracts the post cards from an already parsed HTML tree (see _parse_posts_html)."""
+        posts = []
+        # Find direct children of the posts list (or of <body> for a bare fragment) first
+        post_containers = tree.css(_POST_CARDS_SELECTOR)
+
+        if not post_containers:
+            # Fallback if structure is different (e.g., posts directly under body or another div)
+            post_containers = tree.css(_POST_CARDS_FALLBACK_SELECTOR)
+            if not post_containers:
+                 logging.warning("No 'post-container' divs found in the provided HTML.")
+                 return []
+
+        logging.info(f"Found {len(post_containers)} potential post cards in posts HTML.")
+
+        for post_tag in post_containers:
+            if limit is not None and len(posts) >= limit:
+                break # The caller does not need the remaining cards
+            post_data = PostInfo()
+            try:
+                post_data.id = self._extract_post_id(post_tag)
+
+                # --- Header Info ---
+                time_tag = post_tag.css_first(_POST_TIME_SELECTOR)
+                if time_tag:
+                     post_data.datetime_str = time_tag.text().strip()
+
+                # --- Body Info ---
+                body = post_tag.css_first(_POST_BODY_SELECTOR)
+                if body:
+                     text_parts = body.css(_POST_TEXT_SELECTOR)
+                     # One line per non-empty text node; whitespace-only nodes (between tags, empty <span>s) are dropped
+                     post_data.text = "\n".join([
+                         text
+                         for part in text_parts
+                         for node in part.traverse(include_text=True)
+                         if node.tag == '-text' and (text := node.text_content.strip())
+                     ])
+
+
+                     post_data.has_photo = body.css_first(_POST_PHOTO_SELECTOR) is not None
+                     post_data.has_video = body.css_first(_POST_VIDEO_SELECTOR) is not None
+                     post_data.has_document = _has_class(body, 'isDocument')
+
+                     img_tag = body.css_first(_POST_IMAGE_SELECTOR)
+                     post_data.image_url = (img_tag.attributes.get('src') or None) if img_tag else None
+                     if post_data.image_url and post_data.image_url.startswith('//'):
+                         post_data.image_url = 'https:' + post_data.image_url
+
+                     source_tag = body.css_first(_POST_VIDEO_SOURCE_SELECTOR)
+                     post_data.video_url = (source_tag.attributes.get('src') or None) if source_tag else None
+                     if post_data.video_url and post_data.video_url.startswith('//'):
+                          post_data.video_url = 'https:' + post_data.video_url
+
+                # --- Footer Info (Stats) --- FIX: Use specific selectors
+                # Find the container for the stat buttons (usually the last row or a specific div)
+                # Looking at the provided HTML for posts, they are in a div with class 'col col-12 d-flex'
+                stats_row = post_tag.css_first(_POST_STATS_ROW_SELECTOR)
+                if stats_row:
+                    views_link = shares_link = forwards_span = None
+                    for node in stats_row.css(_POST_STATS_SELECTOR):
+                        title = node.attributes.get('data-original-title') or ''
+                        if node.tag == 'span':
+                            if forwards_span is None and _POST_FORWARDS_TITLE in title:
+                                forwards_span = node
+                        elif views_link is None and _POST_VIEWS_TITLE in title:
+                            views_link = node
+                        elif shares_link is None and _POST_SHARES_TITLE in title:
+                            shares_link = node
+
+                    if views_link:
+                        text = views_link.text().strip()
+                        post_data.views_str = text
+                        post_data.views = self._parse_number(text)
+
+                    if shares_link:
+                        text = shares_link.text().strip()
+                        post_data.shares_str = text
+                        post_data.shares = self._parse_number(text)
+
+                    if forwards_span:
+                         text = forwards_span.text().strip()
+                         post_data.forwards_str = text
+                         post_data.forwards = self._parse_number(text)
+                else:
+                     logging.warning(f"Could not find stats row for post ID {post_data.id}")
+
+
+                # --- Direct Link ---
+                link_icon = post_tag.css_first(_POST_PERMALINK_SELECTOR)
+                if link_icon and link_icon.attributes.get('href'):
+                    href = link_icon.attributes['href']
+                    post_data.tgstat_post_url = self.BASE_URL + href if href.startswith('/') else href # Handle relative/absolute
+
+                # --- Telegram Link ---
+                # Try finding from dropdown first as it seems more reliable in provided HTML
+                dropdown_link = None
+                for candidate in post_tag.css(_POST_DROPDOWN_LINKS_SELECTOR):
+                    if _TG_LINK_RE.search(candidate.attributes.get('href') or ''):
+                        dropdown_link = candidate
+                        break
+                if dropdown_link:
+                     post_data.telegram_post_url = dropdown_link.attributes['href']
+                else: # Fallback
+                    tg_link_icon = post_tag.css_first(_POST_TG_LINK_SELECTOR)
+                    if tg_link_icon and tg_link_icon.attributes.get('href'):
+                          post_data.telegram_post_url = tg_link_icon.attributes['href']
+
+
+                posts.append(post_data)
+            except Exception as e:
+                 logging.error(f"Error parsing post card (ID: {post_data.id}): {e}", exc_info=True)
+                 continue # Skip this post
+
+        return posts
+
+
+def _parse_posts_html_in_process(html_content, limit=None):
+    """Module-level (picklable) entry point for parsing post cards in a ProcessPoolExecutor worker."""
+    return _TGStatBase()._parse_posts_html(html_content, limit)
+
+
+class TGStatParser(_TGStatBase):
+    """
+    A class to interact with TGStat.ru for searching channels and fetching posts.
+    Handles CSRF tokens and session management.
+    """
+
+    def __init__(self, verbose=True, parse_workers=0, cache_ttl=0, cache_dir=None): # verbose flag is now handled by logging level
+        """
+        Initializes the parser with a requests session and fetches the initial CSRF token.
+        The session's pooled connections are released by close(), or on leaving a `with` block.
+
+        Args:
+            parse_workers (int): If > 0, 'load more' batches are parsed in a pool of that many
+                                 worker processes, so parsing does not hold this process's GIL
+                                 while the next batch is being fetched. 0 parses in-process.
+                                 Workers are spawned, so the calling script needs an
+                                 'if __name__ == "__main__":' guard.
+            cache_ttl (int): Seconds a 'load more' response is reused for the same (channel, page, offset).
+                             0 (the default) disables the cache. Cached pages keep the view/share/forward
+                             counts they were fetched with, while the initial page is always fetched fresh.
+            cache_dir (str): Directory for an on-disk copy of the cache (requires diskcache and cache_ttl > 0),
+                             e.g. "./.tgstat_cache". None keeps it in memory only.
+        """
+        # 'spawn' rather than the POSIX default 'fork': forking while prefetch or event-loop threads
+        # hold locks can deadlock the workers
+        self._parse_pool = (ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context('spawn'))
+                            if parse_workers > 0 else None)
+        self._page_cache = _PageCache(ttl=cache_ttl, directory=cache_dir)
+        self.session = requests.Session()
+        # Keep connections to tgstat.ru warm across requests and retry transient failures
+        adapter = HTTPAdapter(
+            pool_connections=20,
+            pool_maxsize=50,
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504]),
+        )
+        self.session.mount('https://', adapter)
+        self.session.headers.update(self.DEFAULT_HEADERS)
+        self.csrf_token_form = None # Token specifically for POST request data bodies
+        self._channel_post_headers_cache = {}
+        if not self._refresh_csrf_token():
+             self.close()
+             logging.error("Failed to initialize TGStatParser: Could not obtain CSRF token.")
+             raise ConnectionError("Failed to initialize TGStatParser: Could not obtain CSRF token.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """Closes the underlying HTTP session and its pooled connections, the parse pool and the page cache."""
+        self.session.close()
+        self._page_cache.close()
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown()
+            self._parse_pool = None
+
+    def _parse_posts_batch(self, html_content, limit):
+        """Parses a 'load more' batch, in the parse process pool when one is configured."""
+        if self._parse_pool is None:
+            return self._parse_posts_html(html_content, limit=limit)
+        return self._parse_pool.submit(_parse_posts_html_in_process, html_content, limit).result()
+
+    def _csrf_cookie(self):
+        """Returns the session's '_tgstat_csrk' cookie value, or None."""
+        try:
+            return self.session.cookies.get('_tgstat_csrk')
+        except requests.cookies.CookieConflictError:
+            return None
+
+    def _refresh_csrf_token(self, url_to_visit=None):
+        """
+        Fetches a page to update session cookies and extract the necessary CSRF token.
+        Returns True if successful, False otherwise.
+        """
+        url = url_to_visit or self.SEARCH_URL # Use search page by default
+        logging.info(f"Refreshing CSRF token from {url}...")
+
         try:
-            if 'm' in text:
-                return int(float(text.replace('m', '')) * 1_000_000)
-            elif 'k' in text:
-                return int(float(text.replace('k', '')) * 1_000)
+            response = self.session.get(url, headers=self.PAGE_GET_HEADERS, timeout=20)
+            response.raise_for_status()
+
+            self.csrf_token_form = self._extract_csrf_token(
+                self._utf8_page(response.content, response.headers.get('Content-Type')))
+            if not self.csrf_token_form:
+                return False
+            if self._csrf_cookie() is not None:
+                logging.info("Session cookie '_tgstat_csrk' is set.")
             else:
-                # Attempt direct conversion first
-                try:
-                    return int(text)
-                except ValueError:
-                     # If direct int fails, try float then int (handles cases like '59.5')
-                     return int(float(text))
-        except ValueError:
-            logging.warning(f"Could not parse number: '{text}'")
-            return None # Indicate parsing failure
+                 logging.warning("Warning: Session cookie '_tgstat_csrk' was not explicitly found after GET, but session might still handle it.")
+            return True
+
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Error refreshing CSRF token: {e}")
+            self.csrf_token_form = None
+            return False
+        except Exception as e:
+            logging.error(f"Unexpected error during CSRF refresh: {e}", exc_info=True)
+            self.csrf_token_form = None
+            return False
+
+    def _post_ajax(self, url, build_body, headers, description, refresh_url=None, cache_key=None):
+        """
+        Sends an AJAX form POST and returns the decoded JSON response, or None on failure.
+        build_body is called for every attempt, so a retry carries the refreshed CSRF token:
+        a rejected token (HTTP 403/419 or a JSON 'csrf' error) triggers one token refresh and retry.
+        With a cache_key, a cached response is returned without a request and 'ok' responses are cached.
+        """
+        cached = self._cached_ajax_response(cache_key, description)
+        if cached is not None:
+            return cached
+        response = None
+        try:
+            for attempt in range(2):
+                response = self.session.post(url, data=build_body(), headers=headers, timeout=20)
+                if response.status_code not in self.CSRF_REJECTED_STATUSES:
+                    response.raise_for_status()
+                    result = _AJAX_DECODER.decode(response.content)
+                    if not self._is_csrf_error(result):
+                        self._cache_ajax_response(cache_key, result, response.content)
+                        return result
+                if attempt == 0:
+                    logging.warning(f"{description} request rejected the CSRF token. Refreshing and retrying once...")
+                    if not self._refresh_csrf_token(refresh_url):
+                        logging.error(f"Failed to refresh CSRF token. {description} request aborted.")
+                        return None
+            logging.error(f"{description} request failed: CSRF token rejected after refresh.")
+            return None
+        except msgspec.DecodeError as e:
+            logging.error(f"Failed to decode JSON response from {description} request: {e}")
+            logging.debug(f"Response Text: {response.text[:500]}...")
+            return None
+        except requests.exceptions.RequestException as e:
+            logging.error(f"{description} request failed: {e}")
+            return None
+
+    def _make_search_request(self, query, page=0, offset=0, sort="participants", country_id=1):
+        """
+        Internal method to perform the actual channel search POST request.
+        """
+        if not self.csrf_token_form:
+            logging.warning("No CSRF form token found. Attempting to refresh...")
+            if not self._refresh_csrf_token():
+                 logging.error("Failed to refresh CSRF token. Search aborted.")
+                 return None
+
+        logging.info(f"Searching channels with query: '{query}', page: {page}, offset: {offset}")
+        return self._post_ajax(
+            self.SEARCH_URL,
+            lambda: self._build_search_body(query, page, offset, sort, country_id),
+            self.SEARCH_POST_HEADERS,
+            "Search",
+        )
 
     def search_channels(self, query, max_pages=1, sort="participants"):
         """
@@ -321,333 +867,649 @@ class TGStatParser:
             sort (str): Sorting criteria (e.g., 'participants', 'avg_reach', 'ci_index').
 
         Returns:
-            list: A list of dictionaries, each containing info about a channel,
+            list[ChannelInfo]: A list of parsed channel cards,
                   or None if the initial search fails. Returns [] if search works but finds nothing.
         """
         all_channels = []
         current_page = 0
         current_offset = 0
-        has_more = True
 
-        while current_page < max_pages and has_more:
-            search_result = self._make_search_request(query, current_page, current_offset, sort)
+        # Pagination cursors come from each JSON response, so pages cannot be fetched in parallel.
+        # Instead, the (delayed) request for page N+1 is issued before page N is parsed,
+        # overlapping parse work with the politeness delay and the network round trip.
+        # Set on every exit so a prefetched page still in its delay is abandoned instead of requested.
+        cancel = threading.Event()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            try:
+                pending = executor.submit(self._make_search_request, query, 0, 0, sort) if max_pages > 0 else None
 
-            if not search_result or search_result.get('status') != 'ok':
-                logging.error("Search request failed or returned error status.")
-                if current_page == 0:
-                     return None
-                else:
-                     break # Stop pagination if a later page fails
+                while pending is not None:
+                    search_result = pending.result()
+                    pending = None
 
-            html_content = search_result.get('html', '')
-            if not html_content:
-                 logging.warning("No HTML content in search response.")
-                 break # Stop if no HTML
+                    if not search_result or search_result.status != 'ok':
+                        logging.error("Search request failed or returned error status.")
+                        if current_page == 0:
+                             return None
+                        else:
+                             break # Stop pagination if a later page fails
 
-            parsed_channels = self._parse_search_html(html_content)
+                    html_content = search_result.html
+                    if not html_content:
+                         logging.warning("No HTML content in search response.")
+                         break # Stop if no HTML
 
-            if not parsed_channels and current_page == 0:
-                 logging.info(f"No channels found for query '{query}'.")
-                 return [] # Return empty list
+                    has_more = search_result.hasMore
+                    next_page = search_result.nextPage if search_result.nextPage is not None else current_page + 1
+                    next_offset = search_result.nextOffset if search_result.nextOffset is not None else current_offset + 30 # Default to 30 per page if not provided
 
-            all_channels.extend(parsed_channels)
-            logging.info(f"Found {len(parsed_channels)} channels on page {current_page + 1}. Total: {len(all_channels)}")
+                    if has_more and next_page < max_pages:
+                        pending = executor.submit(
+                            _call_after_delay, (1.5, 3.0), "next page",
+                            self._make_search_request, query, next_page, next_offset, sort, cancel=cancel
+                        )
 
-            has_more = search_result.get('hasMore', False)
-            current_page = search_result.get('nextPage', current_page + 1)
-            current_offset = search_result.get('nextOffset', current_offset + 30) # Default to 30 if not provided
+                    parsed_channels = self._parse_search_html(html_content)
 
-            if has_more and current_page < max_pages:
-                sleep_time = random.uniform(1.5, 3.0)
-                logging.info(f"Sleeping for {sleep_time:.2f} seconds before next page...")
-                time.sleep(sleep_time) # Politeness delay
+                    if not parsed_channels and current_page == 0:
+                         logging.info(f"No channels found for query '{query}'.")
+                         return [] # Return empty list
+
+                    all_channels.extend(parsed_channels)
+                    logging.info(f"Found {len(parsed_channels)} channels on page {current_page + 1}. Total: {len(all_channels)}")
+
+                    current_page = next_page
+                    current_offset = next_offset
+            finally:
+                cancel.set()
 
         return all_channels
 
     def _get_initial_posts_html(self, channel_username_or_id):
-        """Fetches the initial HTML page for a channel."""
+        """Fetches the initial HTML page for a channel as raw bytes."""
         # Determine segment: remove @ if present
         channel_segment = channel_username_or_id.lstrip('@')
         channel_url = f"{self.BASE_URL}/channel/@{channel_segment}" # TGStat URL structure often uses @ prefix
 
         logging.info(f"Fetching initial posts page: {channel_url}")
-        headers = self.session.headers.copy()
-        headers.update(self.DEFAULT_HEADERS)
-        headers["Referer"] = self.SEARCH_URL # Referer from search results or main page
 
         try:
-            response = self.session.get(channel_url, headers=headers, timeout=20)
+            response = self.session.get(channel_url, headers=self.CHANNEL_GET_HEADERS, timeout=20)
             response.raise_for_status()
-            # Optional: Refresh CSRF token based on this page if needed for subsequent actions
-            # soup = BeautifulSoup(response.text, 'html.parser')
-            # meta_tag = soup.find('meta', {'name': 'csrf-token'})
-            # if meta_tag and 'content' in meta_tag.attrs:
-            #     self.csrf_token_form = meta_tag['content']
-            #     logging.info(f"Refreshed CSRF token from channel page: {self.csrf_token_form[:10]}...")
-            return response.text
+            # Bytes skip building a decoded str copy of the page (tgstat.ru already serves UTF-8)
+            return self._utf8_page(response.content, response.headers.get('Content-Type'))
         except requests.exceptions.RequestException as e:
             logging.error(f"Failed to fetch initial channel page {channel_url}: {e}")
             return None
 
     def _make_more_posts_request(self, channel_username_or_id, last_post_id, offset):
         """Internal method to perform the 'load more posts' POST request."""
+        channel_segment = channel_username_or_id.lstrip('@')
+        channel_page_url = f"{self.BASE_URL}/channel/@{channel_segment}"
+        posts_url = channel_page_url + "/posts-last"
+
         if not self.csrf_token_form:
             logging.warning("No CSRF form token found for loading more posts. Attempting refresh...")
             # Refresh using the channel page itself
-            if not self._refresh_csrf_token(f"{self.BASE_URL}/channel/@{channel_username_or_id.lstrip('@')}"):
+            if not self._refresh_csrf_token(channel_page_url):
                 logging.error("Failed to refresh CSRF token. Load more aborted.")
                 return None
 
-        channel_segment = channel_username_or_id.lstrip('@')
-        posts_url = f"{self.BASE_URL}/channel/@{channel_segment}/posts-last"
-        channel_page_url = f"{self.BASE_URL}/channel/@{channel_segment}"
+        logging.info(f"Requesting more posts for {channel_username_or_id}, page (last_id): {last_post_id}, offset: {offset}")
+        return self._post_ajax(
+            posts_url,
+            lambda: self._build_more_posts_body(last_post_id, offset),
+            self._channel_post_headers(channel_page_url),
+            "'Load more posts'",
+            refresh_url=channel_page_url,
+            cache_key=self._page_cache_key(channel_segment, last_post_id, offset),
+        )
+
+    def _fetch_more_posts(self, channel_username_or_id, last_post_id, offset, cancel=None):
+        """
+        Performs the 'load more posts' request after its politeness delay, which cached pages skip.
+        Returns None without a request if the cancel event is set during the delay.
+        """
+        if self._is_page_cached(channel_username_or_id, last_post_id, offset):
+            return self._make_more_posts_request(channel_username_or_id, last_post_id, offset)
+        return _call_after_delay(
+            (2.0, 4.0), "next post batch",
+            self._make_more_posts_request, channel_username_or_id, last_post_id, offset, cancel=cancel
+        )
 
-        posts_data = {
-            "_tgstat_csrk": self.csrf_token_form,
-            "date": "0",
-            "q": "",
-            "hideDeleted": "1",
-            "hideForwards": "0",
-            "page": last_post_id,
-            "offset": offset,
-        }
-        # Use list of tuples if needed for multi-value params (like hideDeleted=0&hideDeleted=1)
-        posts_data_list = [
-             ("_tgstat_csrk", self.csrf_token_form),
-             ("date", "0"), ("q", ""),
-             ("hideDeleted", "0"), ("hideDeleted", "1"), # As per curl
-             ("hideForwards", "0"), # As per curl
-             ("page", last_post_id), ("offset", offset),
-        ]
-
-
-        headers = self.session.headers.copy()
-        headers.update(self.AJAX_HEADERS)
-        headers["Referer"] = channel_page_url
+    def get_channel_posts(self, channel_username_or_id, max_posts=50):
+        """
+        Fetches posts from a specific channel page, handling pagination.
 
-        logging.info(f"Requesting more posts for {channel_username_or_id}, page (last_id): {last_post_id}, offset: {offset}")
-        try:
-            response = self.session.post(
-                posts_url,
-                data=urlencode(posts_data_list, doseq=True), # Use list for multi-value
-                # data=posts_data, # Use dict if no multi-value needed
-                headers=headers,
-                timeout=20
-            )
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logging.error(f"'Load more posts' request failed: {e}")
-            return None
-        except json.JSONDecodeError:
-            logging.error(f"Failed to decode JSON response from 'load more posts'.")
-            logging.debug(f"Response Text: {response.text[:500]}...")
-            return None
+        Args:
+            channel_username_or_id (str): The channel's username (e.g., '@rian_ru') or its TGStat ID.
+            max_posts (int): The approximate maximum number of posts to retrieve.
 
-    def _extract_post_id(self, post_tag):
-        """Extracts numeric post ID from tag id like 'post-71374303853'."""
-        post_id_str = post_tag.get('id', '')
-        match = re.search(r'post-(\d+)', post_id_str)
-        return int(match.group(1)) if match else None
+        Returns:
+            list[PostInfo]: A list of parsed post cards,
+                  or None if the initial page fetch fails. Returns [] if no posts found.
+                  With cache_ttl set, posts past the first page may carry stats up to cache_ttl seconds old.
+        """
+        if not channel_username_or_id:
+             logging.error("Channel username or ID cannot be empty.")
+             return None
 
-    def _parse_posts_html(self, html_content):
-        """Parses HTML containing one or more post cards."""
-        soup = BeautifulSoup(html_content, 'html.parser')
-        posts = []
-        # Find container first
-        container = soup.find('div', class_='posts-list') or soup
-        post_containers = container.find_all('div', class_='post-container', recursive=False) # Find direct children first
+        # 1. Get Initial Posts
+        initial_html = self._get_initial_posts_html(channel_username_or_id)
+        if not initial_html:
+            return None # Error already logged
 
-        if not post_containers:
-            # Fallback if structure is different (e.g., posts directly under body or another div)
-            post_containers = soup.find_all('div', class_='post-container')
-            if not post_containers:
-                 logging.warning("No 'post-container' divs found in the provided HTML.")
-                 return []
+        # The channel page carries a fresh CSRF token bound to our session cookie, so pick it up
+        # from the same parse and spare the 'load more' requests a separate refresh fetch.
+        csrf_token, all_posts = self._parse_channel_page(initial_html, limit=max_posts)
+        if csrf_token:
+            self.csrf_token_form = csrf_token
+        if not all_posts:
+            logging.info(f"No initial posts found or parsed for {channel_username_or_id}.")
+            return [] # Return empty list
 
-        logging.info(f"Found {len(post_containers)} potential post cards in posts HTML.")
+        logging.info(f"Fetched {len(all_posts)} initial posts for {channel_username_or_id}.")
 
-        for post_tag in post_containers:
-            post_data = {}
+        last_post_id = all_posts[-1].id
+        current_offset = len(all_posts) # Initial offset is the number of posts already loaded
+        batch_size = len(all_posts) # Expected size of a 'load more' batch, from the latest one seen
+        has_more = True # Assume more unless told otherwise
+        # Guards against a server that misreports hasMore and serves the same page again
+        seen_cursors = set()
+        seen_pages = set()
+
+        # 2. Loop for More Posts
+        # When the response already carries the next cursor, the following batch is requested
+        # (after its politeness delay) on a worker thread while the current batch is parsed,
+        # unless the current batch is expected to fill max_posts on its own.
+        # Set on every exit so a prefetched batch still in its delay is abandoned instead of requested.
+        cancel = threading.Event()
+        with ThreadPoolExecutor(max_workers=2) as executor:
             try:
-                post_data['id'] = self._extract_post_id(post_tag)
+                pending = None
+                while len(all_posts) < max_posts and has_more and last_post_id:
+                    if pending is None:
+                        if str(last_post_id) in seen_cursors:
+                            logging.warning(f"Page cursor {last_post_id} was already requested. Stopping.")
+                            break
+                        seen_cursors.add(str(last_post_id))
+                        pending = executor.submit(self._fetch_more_posts, channel_username_or_id, last_post_id, current_offset, cancel)
+                    more_posts_result = pending.result()
+                    pending = None
+
+                    if not more_posts_result or more_posts_result.status != 'ok':
+                        logging.error("Failed to load more posts or received error status.")
+                        break # Stop
+
+                    html_content = more_posts_result.html
+                    if not html_content:
+                        logging.warning("No HTML content in 'load more' response.")
+                        # Sometimes hasMore is true but html is empty, treat as end
+                        has_more = False
+                        break
+                    page_hash = hash(html_content)
+                    if page_hash in seen_pages:
+                        logging.warning("'Load more' returned a page that was already parsed. Stopping.")
+                        break
+                    seen_pages.add(page_hash)
+
+                    # Update pagination info from the JSON response
+                    has_more = more_posts_result.hasMore
+                    # Use the 'nextPage' from the response as the ID for the *next* request's 'page' parameter
+                    next_page_id = more_posts_result.nextPage
+                    next_offset = more_posts_result.nextOffset
+                    if (has_more and next_page_id and next_offset is not None and len(all_posts) + batch_size < max_posts
+                            and str(next_page_id) not in seen_cursors):
+                        seen_cursors.add(str(next_page_id))
+                        pending = executor.submit(self._fetch_more_posts, channel_username_or_id, next_page_id, next_offset, cancel)
+
+                    new_posts = self._parse_posts_batch(html_content, max_posts - len(all_posts))
+                    if not new_posts:
+                         logging.info("No more posts found in the loaded content.")
+                         has_more = False # Explicitly set based on parsing result
+                         break # Stop
+
+                    all_posts.extend(new_posts)
+                    batch_size = len(new_posts)
+                    logging.info(f"Fetched {len(new_posts)} more posts. Total: {len(all_posts)}")
+
+                    if next_page_id is None: # If nextPage isn't in response, fallback to last parsed post ID
+                         last_post_id = new_posts[-1].id
+                         logging.warning(f"nextPage not found in response, using last parsed post ID: {last_post_id}")
+                    else:
+                         last_post_id = next_page_id
+
+                    # Update offset based on response or calculation
+                    current_offset = next_offset if next_offset is not None else current_offset + len(new_posts)
+
+                    if not last_post_id:
+                         logging.warning("Could not determine next post ID for pagination. Stopping.")
+                         break
+
+                    if not has_more:
+                         logging.info("'hasMore' is false in response. Reached end of posts.")
+            finally:
+                cancel.set()
 
-                # --- Header Info ---
-                header = post_tag.find('div', class_='post-header')
-                if header:
-                     time_tag = header.find('small')
-                     post_data['datetime_str'] = time_tag.text.strip() if time_tag else 'N/A'
+        return all_posts[:max_posts] # Return up to max_posts
 
-                # --- Body Info ---
-                body = post_tag.find('div', class_='post-body')
-                if body:
-                     text_parts = body.find_all('div', class_='post-text')
-                     # Combine text, handling potential None values from get_text
-                     post_data['text'] = "\n".join(
-                         filter(None, (part.get_text(separator='\n', strip=True) for part in text_parts))
-                     ).strip()
-
-
-                     post_data['has_photo'] = bool(body.find('div', class_='post-img')) or bool(body.find('div', class_='carousel'))
-                     post_data['has_video'] = bool(body.find('div', class_='wrapper-thumbnail')) or bool(body.find('div', class_='wrapper-video'))
-                     post_data['has_document'] = 'isDocument' in body.get('class', [])
-
-                     img_tag = body.find('img', class_='post-img-img')
-                     post_data['image_url'] = img_tag['src'] if img_tag and img_tag.get('src') else None
-                     if post_data['image_url'] and post_data['image_url'].startswith('//'):
-                         post_data['image_url'] = 'https:' + post_data['image_url']
-
-                     video_tag = body.find('video')
-                     if video_tag and video_tag.find('source') and video_tag.find('source').get('src'):
-                          post_data['video_url'] = video_tag.find('source')['src']
-                          if post_data['video_url'].startswith('//'):
-                               post_data['video_url'] = 'https:' + post_data['video_url']
-                     else:
-                          post_data['video_url'] = None
+    def get_channel_posts_columnar(self, channel_username_or_id, max_posts=50):
+        """
+        Same as get_channel_posts, but returns the posts as a dict of per-field lists (see to_columns).
+        Returns None if the initial page fetch fails.
+        """
+        posts = self.get_channel_posts(channel_username_or_id, max_posts)
+        return None if posts is None else to_columns(posts, PostInfo)
 
-                # --- Footer Info (Stats) --- FIX: Use specific selectors
-                post_data['views_str'] = 'N/A'
-                post_data['views'] = None
-                post_data['shares_str'] = 'N/A'
-                post_data['shares'] = None
-                post_data['forwards_str'] = 'N/A'
-                post_data['forwards'] = None
 
-                # Find the container for the stat buttons (usually the last row or a specific div)
-                # Looking at the provided HTML for posts, they are in a div with class 'col col-12 d-flex'
-                stats_row = post_tag.select_one('.col.col-12.d-flex')
-                if stats_row:
-                    views_link = stats_row.select_one('a.btn[data-original-title*="Количество просмотров публикации"]')
-                    if views_link:
-                        text = views_link.text.strip()
-                        post_data['views_str'] = text
-                        post_data['views'] = self._parse_number(text)
+class AsyncTGStatParser(_TGStatBase):
+    """
+    Asynchronous counterpart of TGStatParser built on httpx.
 
-                    shares_link = stats_row.select_one('a.btn[data-original-title*="Поделились"]')
-                    if shares_link:
-                        text = shares_link.text.strip()
-                        post_data['shares_str'] = text
-                        post_data['shares'] = self._parse_number(text)
+    All requests share one AsyncClient and cookie jar, so many channels or queries can be
+    scraped concurrently on a single event loop, multiplexed over one TLS connection to tgstat.ru
+    when h2 is installed (httpx[http2]). HTML parsing runs in worker threads to keep
+    the loop responsive. Use as an async context manager:
 
-                    forwards_span = stats_row.select_one('span.btn[data-original-title*="Пересылок всего"]')
-                    if forwards_span:
-                         text = forwards_span.text.strip()
-                         post_data['forwards_str'] = text
-                         post_data['forwards'] = self._parse_number(text)
-                else:
-                     logging.warning(f"Could not find stats row for post ID {post_data.get('id', 'N/A')}")
+        async with AsyncTGStatParser() as parser:
+            posts_by_channel = await parser.get_many_channel_posts(['@rian_ru', '@tass_agency'])
+    """
 
+    def __init__(self, max_concurrency=10, parse_workers=0, cache_ttl=0, cache_dir=None):
+        """
+        Prepares the parser. The HTTP session and the initial CSRF token are set up in __aenter__.
 
-                # --- Direct Link ---
-                link_icon = post_tag.find('a', {'data-original-title': 'Постоянная ссылка на публикацию'})
-                if link_icon and link_icon.get('href'):
-                    href = link_icon['href']
-                    post_data['tgstat_post_url'] = self.BASE_URL + href if href.startswith('/') else href # Handle relative/absolute
+        Args:
+            max_concurrency (int): Maximum number of channels/queries scraped at the same time
+                                   by get_many_channel_posts and search_many.
+            parse_workers (int): If > 0, 'load more' batches are parsed in a pool of that many
+                                 worker processes instead of threads, so concurrent channels
+                                 do not serialize on the GIL. 0 parses in worker threads.
+            cache_ttl (int), cache_dir (str): 'load more' response cache, see TGStatParser.
+        """
+        if httpx is None:
+            raise ImportError("AsyncTGStatParser requires httpx: pip install 'httpx[http2]'")
+        # 'spawn' rather than the POSIX default 'fork': forking while prefetch or event-loop threads
+        # hold locks can deadlock the workers
+        self._parse_pool = (ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context('spawn'))
+                            if parse_workers > 0 else None)
+        self._page_cache = _PageCache(ttl=cache_ttl, directory=cache_dir)
+        self.session = None
+        self.csrf_token_form = None # Token specifically for POST request data bodies
+        self._channel_post_headers_cache = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._csrf_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        if not _HTTP2_AVAILABLE:
+            logging.info("h2 is not installed; AsyncTGStatParser falls back to HTTP/1.1.")
+        self.session = httpx.AsyncClient(
+            http2=_HTTP2_AVAILABLE,
+            # Connection-specific headers are forbidden in HTTP/2
+            headers={k: v for k, v in self.DEFAULT_HEADERS.items() if k != "Connection"},
+            timeout=20,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+            follow_redirects=True,
+        )
+        if not await self._refresh_csrf_token():
+            await self.close()
+            logging.error("Failed to initialize AsyncTGStatParser: Could not obtain CSRF token.")
+            raise ConnectionError("Failed to initialize AsyncTGStatParser: Could not obtain CSRF token.")
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """Closes the underlying HTTP session, the parse pool and the page cache."""
+        self._page_cache.close()
+        if self.session is not None:
+            await self.session.aclose()
+            self.session = None
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(wait=False)
+            self._parse_pool = None
+
+    async def _parse_posts_batch(self, html_content, limit):
+        """Parses a 'load more' batch off the event loop, in the parse process pool when one is configured."""
+        if self._parse_pool is None:
+            return await asyncio.to_thread(self._parse_posts_html, html_content, limit)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._parse_pool, _parse_posts_html_in_process, html_content, limit
+        )
+
+    async def _refresh_csrf_token(self, url_to_visit=None):
+        """
+        Fetches a page to update session cookies and extract the necessary CSRF token.
+        Concurrent callers share a single refresh. Returns True if successful, False otherwise.
+        """
+        stale_token = self.csrf_token_form
+        async with self._csrf_lock:
+            if self.csrf_token_form and self.csrf_token_form != stale_token:
+                return True # Another task refreshed the token while we were waiting
 
-                # --- Telegram Link ---
-                # Try finding from dropdown first as it seems more reliable in provided HTML
-                dropdown_link = post_tag.find('a', {'class': 'dropdown-item', 'target': '_blank', 'href': re.compile(r'https://t(?:elegram)?\.(?:me|org)/|https://ttttt\.me/')})
-                if dropdown_link:
-                     post_data['telegram_post_url'] = dropdown_link['href']
-                else: # Fallback
-                    tg_link_icon = post_tag.find('a', title=lambda x: x and 'Открыть в Telegram' in x)
-                    if tg_link_icon and tg_link_icon.get('href'):
-                          post_data['telegram_post_url'] = tg_link_icon['href']
+            url = url_to_visit or self.SEARCH_URL # Use search page by default
+            logging.info(f"Refreshing CSRF token from {url}...")
+            try:
+                response = await self.session.get(url, headers=self.PAGE_GET_HEADERS)
+                response.raise_for_status()
+                self.csrf_token_form = await asyncio.to_thread(
+                    self._extract_csrf_token, self._utf8_page(response.content, response.headers.get('Content-Type')))
+                if not self.csrf_token_form:
+                    return False
+                return True
+            except httpx.HTTPError as e:
+                logging.error(f"Error refreshing CSRF token: {e}")
+                self.csrf_token_form = None
+                return False
+
+    async def _page_cache_call(self, func, *args):
+        """Runs a page-cache method, in a worker thread when it may hit the on-disk tier."""
+        if self._page_cache.on_disk:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    async def _post_ajax(self, url, build_body, headers, description, refresh_url=None, cache_key=None):
+        """
+        Sends an AJAX form POST and returns the decoded JSON response, or None on failure.
+        A rejected CSRF token triggers one token refresh and a retry with a rebuilt body.
+        With a cache_key, responses go through the page cache as in TGStatParser._post_ajax.
+        """
+        cached = await self._page_cache_call(self._cached_ajax_response, cache_key, description)
+        if cached is not None:
+            return cached
+        try:
+            for attempt in range(2):
+                response = await self.session.post(url, content=build_body(), headers=headers)
+                if response.status_code not in self.CSRF_REJECTED_STATUSES:
+                    response.raise_for_status()
+                    result = _AJAX_DECODER.decode(response.content)
+                    if not self._is_csrf_error(result):
+                        await self._page_cache_call(self._cache_ajax_response, cache_key, result, response.content)
+                        return result
+                if attempt == 0:
+                    logging.warning(f"{description} request rejected the CSRF token. Refreshing and retrying once...")
+                    if not await self._refresh_csrf_token(refresh_url):
+                        logging.error(f"Failed to refresh CSRF token. {description} request aborted.")
+                        return None
+            logging.error(f"{description} request failed: CSRF token rejected after refresh.")
+            return None
+        except httpx.HTTPError as e:
+            logging.error(f"{description} request failed: {e}")
+            return None
+        except msgspec.DecodeError as e:
+            logging.error(f"Failed to decode JSON response from {description} request: {e}")
+            return None
 
+    async def _make_search_request(self, query, page=0, offset=0, sort="participants", country_id=1):
+        """Internal method to perform the actual channel search POST request."""
+        if not self.csrf_token_form and not await self._refresh_csrf_token():
+            logging.error("Failed to refresh CSRF token. Search aborted.")
+            return None
 
-                posts.append(post_data)
-            except Exception as e:
-                 logging.error(f"Error parsing post card (ID: {post_data.get('id', 'N/A')}): {e}", exc_info=True)
-                 continue # Skip this post
+        logging.info(f"Searching channels with query: '{query}', page: {page}, offset: {offset}")
+        return await self._post_ajax(
+            self.SEARCH_URL,
+            lambda: self._build_search_body(query, page, offset, sort, country_id),
+            self.SEARCH_POST_HEADERS,
+            "Search",
+        )
+
+    async def search_channels(self, query, max_pages=1, sort="participants"):
+        """
+        Searches for channels on TGStat. See TGStatParser.search_channels for the return value.
+        """
+        all_channels = []
+        current_page = 0
+        current_offset = 0
+        has_more = True
 
-        return posts
+        while current_page < max_pages and has_more:
+            search_result = await self._make_search_request(query, current_page, current_offset, sort)
 
-    def get_channel_posts(self, channel_username_or_id, max_posts=50):
-        """
-        Fetches posts from a specific channel page, handling pagination.
+            if not search_result or search_result.status != 'ok':
+                logging.error("Search request failed or returned error status.")
+                if current_page == 0:
+                     return None
+                break # Stop pagination if a later page fails
 
-        Args:
-            channel_username_or_id (str): The channel's username (e.g., '@rian_ru') or its TGStat ID.
-            max_posts (int): The approximate maximum number of posts to retrieve.
+            html_content = search_result.html
+            if not html_content:
+                 logging.warning("No HTML content in search response.")
+                 break
 
-        Returns:
-            list: A list of dictionaries, each containing info about a post,
-                  or None if the initial page fetch fails. Returns [] if no posts found.
+            parsed_channels = await asyncio.to_thread(self._parse_search_html, html_content)
+            if not parsed_channels and current_page == 0:
+                 logging.info(f"No channels found for query '{query}'.")
+                 return []
+
+            all_channels.extend(parsed_channels)
+            logging.info(f"Found {len(parsed_channels)} channels on page {current_page + 1}. Total: {len(all_channels)}")
+
+            has_more = search_result.hasMore
+            current_page = search_result.nextPage if search_result.nextPage is not None else current_page + 1
+            current_offset = search_result.nextOffset if search_result.nextOffset is not None else current_offset + 30 # Default to 30 if not provided
+
+            if has_more and current_page < max_pages:
+                await asyncio.sleep(random.uniform(1.5, 3.0)) # Politeness delay
+
+        return all_channels
+
+    async def _get_initial_posts_html(self, channel_username_or_id):
+        """Fetches the initial HTML page for a channel as raw bytes."""
+        channel_url = f"{self.BASE_URL}/channel/@{channel_username_or_id.lstrip('@')}"
+        logging.info(f"Fetching initial posts page: {channel_url}")
+        try:
+            response = await self.session.get(channel_url, headers=self.CHANNEL_GET_HEADERS)
+            response.raise_for_status()
+            return self._utf8_page(response.content, response.headers.get('Content-Type'))
+        except httpx.HTTPError as e:
+            logging.error(f"Failed to fetch initial channel page {channel_url}: {e}")
+            return None
+
+    async def _make_more_posts_request(self, channel_username_or_id, last_post_id, offset):
+        """Internal method to perform the 'load more posts' POST request."""
+        channel_segment = channel_username_or_id.lstrip('@')
+        channel_page_url = f"{self.BASE_URL}/channel/@{channel_segment}"
+        if not self.csrf_token_form and not await self._refresh_csrf_token(channel_page_url):
+            logging.error("Failed to refresh CSRF token. Load more aborted.")
+            return None
+
+        logging.info(f"Requesting more posts for {channel_username_or_id}, page (last_id): {last_post_id}, offset: {offset}")
+        return await self._post_ajax(
+            f"{channel_page_url}/posts-last",
+            lambda: self._build_more_posts_body(last_post_id, offset),
+            self._channel_post_headers(channel_page_url),
+            "'Load more posts'",
+            refresh_url=channel_page_url,
+            cache_key=self._page_cache_key(channel_segment, last_post_id, offset),
+        )
+
+    async def get_channel_posts(self, channel_username_or_id, max_posts=50):
+        """
+        Fetches posts from a specific channel page, handling pagination.
+        See TGStatParser.get_channel_posts for the return value.
         """
         if not channel_username_or_id:
              logging.error("Channel username or ID cannot be empty.")
              return None
 
-        # 1. Get Initial Posts
-        initial_html = self._get_initial_posts_html(channel_username_or_id)
+        initial_html = await self._get_initial_posts_html(channel_username_or_id)
         if not initial_html:
             return None # Error already logged
 
-        all_posts = self._parse_posts_html(initial_html)
+        csrf_token, all_posts = await asyncio.to_thread(self._parse_channel_page, initial_html, max_posts)
+        if csrf_token:
+            self.csrf_token_form = csrf_token # Spares the 'load more' requests a refresh fetch
         if not all_posts:
             logging.info(f"No initial posts found or parsed for {channel_username_or_id}.")
-            return [] # Return empty list
+            return []
 
-        logging.info(f"Fetched {len(all_posts)} initial posts for {channel_username_or_id}.")
-
-        last_post_id = all_posts[-1].get('id')
+        last_post_id = all_posts[-1].id
         current_offset = len(all_posts) # Initial offset is the number of posts already loaded
-        has_more = True # Assume more unless told otherwise
+        batch_size = len(all_posts) # Expected size of a 'load more' batch, from the latest one seen
+        has_more = True
+        # Guards against a server that misreports hasMore and serves the same page again
+        seen_cursors = set()
+        seen_pages = set()
+
+        async def fetch_batch(page_id, offset):
+            if not await self._page_cache_call(self._is_page_cached, channel_username_or_id, page_id, offset):
+                await asyncio.sleep(random.uniform(2.0, 4.0)) # Politeness delay
+            return await self._make_more_posts_request(channel_username_or_id, page_id, offset)
+
+        # When the response already carries the next cursor, the following batch is requested
+        # (after its politeness delay) while the current batch is parsed in a worker thread,
+        # unless the current batch is expected to fill max_posts on its own.
+        pending = None
+        try:
+            while len(all_posts) < max_posts and has_more and last_post_id:
+                if pending is None:
+                    if str(last_post_id) in seen_cursors:
+                        logging.warning(f"Page cursor {last_post_id} was already requested. Stopping.")
+                        break
+                    seen_cursors.add(str(last_post_id))
+                    pending = asyncio.create_task(fetch_batch(last_post_id, current_offset))
+                more_posts_result = await pending
+                pending = None
+
+                if not more_posts_result or more_posts_result.status != 'ok':
+                    logging.error("Failed to load more posts or received error status.")
+                    break
+
+                html_content = more_posts_result.html
+                if not html_content:
+                    logging.warning("No HTML content in 'load more' response.")
+                    break
+                page_hash = hash(html_content)
+                if page_hash in seen_pages:
+                    logging.warning("'Load more' returned a page that was already parsed. Stopping.")
+                    break
+                seen_pages.add(page_hash)
+
+                has_more = more_posts_result.hasMore
+                next_page_id = more_posts_result.nextPage
+                next_offset = more_posts_result.nextOffset
+                if (has_more and next_page_id and next_offset is not None and len(all_posts) + batch_size < max_posts
+                        and str(next_page_id) not in seen_cursors):
+                    seen_cursors.add(str(next_page_id))
+                    pending = asyncio.create_task(fetch_batch(next_page_id, next_offset))
+
+                new_posts = await self._parse_posts_batch(html_content, max_posts - len(all_posts))
+                if not new_posts:
+                     logging.info("No more posts found in the loaded content.")
+                     break
+
+                all_posts.extend(new_posts)
+                batch_size = len(new_posts)
+                logging.info(f"Fetched {len(new_posts)} more posts for {channel_username_or_id}. Total: {len(all_posts)}")
+
+                last_post_id = new_posts[-1].id if next_page_id is None else next_page_id
+                current_offset = next_offset if next_offset is not None else current_offset + len(new_posts)
+        finally:
+            if pending is not None:
+                pending.cancel() # A prefetched batch nobody will read
+                await asyncio.gather(pending, return_exceptions=True)
+
+        return all_posts[:max_posts]
+
+    async def get_channel_posts_columnar(self, channel_username_or_id, max_posts=50):
+        """Same as get_channel_posts, but returns the posts as a dict of per-field lists (see to_columns)."""
+        posts = await self.get_channel_posts(channel_username_or_id, max_posts)
+        return None if posts is None else to_columns(posts, PostInfo)
+
+    async def _bounded(self, coro):
+        """Awaits coro while holding one of the max_concurrency slots."""
+        async with self._semaphore:
+            return await coro
+
+    async def search_many(self, queries, max_pages=1, sort="participants"):
+        """
+        Runs several channel searches concurrently.
 
-        # 2. Loop for More Posts
-        while len(all_posts) < max_posts and has_more and last_post_id:
-            sleep_time = random.uniform(2.0, 4.0)
-            logging.info(f"Sleeping for {sleep_time:.2f} seconds before next post batch...")
-            time.sleep(sleep_time)
+        Returns:
+            dict: Maps each query to the result of search_channels.
+        """
+        results = await asyncio.gather(
+            *(self._bounded(self.search_channels(query, max_pages, sort)) for query in queries)
+        )
+        return dict(zip(queries, results))
 
-            more_posts_result = self._make_more_posts_request(channel_username_or_id, last_post_id, current_offset)
+    async def get_many_channel_posts(self, channels, max_posts=50):
+        """
+        Fetches posts for several channels concurrently.
 
-            if not more_posts_result or more_posts_result.get('status') != 'ok':
-                logging.error("Failed to load more posts or received error status.")
-                break # Stop
+        Returns:
+            dict: Maps each channel to the result of get_channel_posts.
+        """
+        results = await asyncio.gather(
+            *(self._bounded(self.get_channel_posts(channel, max_posts)) for channel in channels)
+        )
+        return dict(zip(channels, results))
 
-            html_content = more_posts_result.get('html', '')
-            if not html_content:
-                logging.warning("No HTML content in 'load more' response.")
-                # Sometimes hasMore is true but html is empty, treat as end
-                has_more = False
-                break
-
-            new_posts = self._parse_posts_html(html_content)
-            if not new_posts:
-                 logging.info("No more posts found in the loaded content.")
-                 has_more = False # Explicitly set based on parsing result
-                 break # Stop
-
-            all_posts.extend(new_posts)
-            logging.info(f"Fetched {len(new_posts)} more posts. Total: {len(all_posts)}")
-
-            # Update pagination info from the JSON response
-            has_more = more_posts_result.get('hasMore', False)
-            # Use the 'nextPage' from the response as the ID for the *next* request's 'page' parameter
-            next_page_id = more_posts_result.get('nextPage')
-            if next_page_id is None: # If nextPage isn't in response, fallback to last parsed post ID
-                 last_post_id = new_posts[-1].get('id')
-                 logging.warning(f"nextPage not found in response, using last parsed post ID: {last_post_id}")
-            else:
-                 last_post_id = next_page_id
 
-            # Update offset based on response or calculation
-            current_offset = more_posts_result.get('nextOffset', current_offset + len(new_posts))
+def search_many(queries, max_pages=1, sort="participants", max_workers=8):
+    """
+    Runs several channel searches in parallel.
 
-            if not last_post_id:
-                 logging.warning("Could not determine next post ID for pagination. Stopping.")
-                 break
+    Each worker thread owns its own TGStatParser, since a session is not safe to share
+    while CSRF refreshes and paginated searches run concurrently.
 
-            if not has_more:
-                 logging.info("'hasMore' is false in response. Reached end of posts.")
+    Args:
+        queries (list[str]): The search terms.
+        max_pages (int): Maximum number of result pages to fetch per query.
+        sort (str): Sorting criteria passed to TGStatParser.search_channels.
+        max_workers (int): Maximum number of concurrent searches.
 
+    Returns:
+        dict: Maps each query to the result of TGStatParser.search_channels
+              (None for queries whose parser could not be initialized).
+    """
+    if not queries:
+        return {}
 
-        return all_posts[:max_posts] # Return up to max_posts
+    worker_state = threading.local()
+    parsers = [] # Every worker's parser, closed once all searches are done
+
+    def run_search(query):
+        parser = getattr(worker_state, 'parser', None)
+        if parser is None:
+            try:
+                parser = worker_state.parser = TGStatParser()
+            except ConnectionError as e:
+                logging.error(f"Search for '{query}' skipped: {e}")
+                return None
+            parsers.append(parser)
+        return parser.search_channels(query, max_pages=max_pages, sort=sort)
+
+    try:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(queries))) as executor:
+            return dict(zip(queries, executor.map(run_search, queries)))
+    finally:
+        for parser in parsers:
+            parser.close()
+
+
+def get_many_channel_posts(channels, max_posts=50, max_concurrency=10):
+    """
+    Synchronous entry point for AsyncTGStatParser.get_many_channel_posts.
+
+    Runs its own event loop via asyncio.run, so it must not be called from inside a running loop.
+    Raises ConnectionError if the initial CSRF token cannot be obtained.
+
+    Returns:
+        dict: Maps each channel to its list of PostInfo (or None), as get_channel_posts returns it.
+    """
+    async def run():
+        async with AsyncTGStatParser(max_concurrency=max_concurrency) as parser:
+            return await parser.get_many_channel_posts(channels, max_posts=max_posts)
+
+    return asyncio.run(run())
 
 
 # --- Main execution block ---
 if __name__ == "__main__":
+    parser = None
     try:
         parser = TGStatParser()
 
@@ -658,26 +1520,28 @@ if __name__ == "__main__":
 
         if channels:
             print(f"\nFound {len(channels)} channels:")
+            lines = [] # Collected and written in one call
             for i, ch in enumerate(channels[:5]): # Print details of first 5 found
-                print(f"{i+1}. Title: {ch['title']}") # <-- Check this output
-                print(f"   Username: {ch['username']}")
-                print(f"   Subscribers: {ch.get('subscribers_str', 'N/A')} ({ch.get('subscribers', 'N/A')})")
-                print(f"   Avg. Reach: {ch.get('avg_reach_str', 'N/A')} ({ch.get('avg_reach', 'N/A')})")
-                print(f"   CI Index: {ch.get('ci_index_str', 'N/A')} ({ch.get('ci_index', 'N/A')})")
-                print(f"   Category: {ch['category']}")
-                print(f"   TGStat URL: {ch['tgstat_url']}") # <-- Check this output
-                print("-" * 15)
+                lines.append(f"{i+1}. Title: {ch.title}") # <-- Check this output
+                lines.append(f"   Username: {ch.username}")
+                lines.append(f"   Subscribers: {ch.subscribers_str} ({ch.subscribers})")
+                lines.append(f"   Avg. Reach: {ch.avg_reach_str} ({ch.avg_reach})")
+                lines.append(f"   CI Index: {ch.ci_index_str} ({ch.ci_index})")
+                lines.append(f"   Category: {ch.category}")
+                lines.append(f"   TGStat URL: {ch.tgstat_url}") # <-- Check this output
+                lines.append("-" * 15)
+            sys.stdout.write("\n".join(lines) + "\n")
 
             # --- Example 2: Get posts from a specific channel (e.g., @rian_ru) ---
             # Let's target @rian_ru directly since it's in the example and likely exists
             target_channel_user = "@rian_ru"
             # Or uncomment below to use the first search result if needed
             # target_channel_user = None
-            # if channels and channels[0].get('username'):
-            #     target_channel_user = channels[0]['username']
+            # if channels and channels[0].username:
+            #     target_channel_user = channels[0].username
             # elif channels:
             #     # Fallback using ID from URL
-            #     match = re.search(r'/channel/(?:\@)?([\w\d\-]+)/stat', channels[0]['tgstat_url'])
+            #     match = _CHANNEL_HREF_RE.search(channels[0].tgstat_url)
             #     target_channel_user = match.group(1) if match else None
 
             if target_channel_user:
@@ -687,22 +1551,22 @@ if __name__ == "__main__":
 
                 if posts:
                     print(f"\nFetched {len(posts)} posts for {target_channel_user}:")
+                    lines = [] # Collected and written in one call
                     for i, post in enumerate(posts[:10]): # Print details of first 10 posts
-                        print(f"\nPost {i+1} (ID: {post.get('id', 'N/A')})")
-                        print(f"  Time: {post.get('datetime_str', 'N/A')}")
-                        print(f"  Views: {post.get('views_str', 'N/A')}")     # <-- Check this output
-                        print(f"  Shares: {post.get('shares_str', 'N/A')}")    # <-- Check this output
-                        print(f"  Forwards: {post.get('forwards_str', 'N/A')}") # <-- Check this output
-                        text_preview = post.get('text', '')
-                        if len(text_preview) > 150:
-                             text_preview = text_preview[:150] + "..."
-                        print(f"  Text: {text_preview}")
-                        if post.get('image_url'): print(f"  Image: Yes ({post['image_url']})")
-                        if post.get('video_url'): print(f"  Video: Yes ({post['video_url']})")
-                        if post.get('has_document'): print(f"  Document: Yes")
-                        print(f"  TGStat Link: {post.get('tgstat_post_url', 'N/A')}")
-                        print(f"  Telegram Link: {post.get('telegram_post_url', 'N/A')}")
-                        print("-" * 15)
+                        lines.append(f"\nPost {i+1} (ID: {post.id})")
+                        lines.append(f"  Time: {post.datetime_str}")
+                        lines.append(f"  Views: {post.views_str}")     # <-- Check this output
+                        lines.append(f"  Shares: {post.shares_str}")    # <-- Check this output
+                        lines.append(f"  Forwards: {post.forwards_str}") # <-- Check this output
+                        text_preview = post.text
+                        lines.append(f"  Text: {text_preview[:150]}..." if len(text_preview) > 150 else f"  Text: {text_preview}")
+                        if post.image_url: lines.append(f"  Image: Yes ({post.image_url})")
+                        if post.video_url: lines.append(f"  Video: Yes ({post.video_url})")
+                        if post.has_document: lines.append("  Document: Yes")
+                        lines.append(f"  TGStat Link: {post.tgstat_post_url or 'N/A'}")
+                        lines.append(f"  Telegram Link: {post.telegram_post_url or 'N/A'}")
+                        lines.append("-" * 15)
+                    sys.stdout.write("\n".join(lines) + "\n")
                 elif posts == []:
                      print(f"\n[*] No posts found for channel {target_channel_user}.")
                 else:
@@ -721,3 +1585,6 @@ if __name__ == "__main__":
          print(f"\n[!] An unexpected error occurred: {e}")
          import traceback
          traceback.print_exc() # Print full traceback for unexpected errors
+    finally:
+        if parser is not None:
+            parser.close()